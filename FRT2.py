@@ -1,8 +1,17 @@
+import io
 import os
-import cv2
-import numpy as np
+from PIL import Image
 from google.cloud import storage
-from tempfile import NamedTemporaryFile
+
+# Cloud Functions reuse the interpreter between invocations
+DEST_BUCKET_NAME = os.environ.get('PROCESSED_BUCKET_NAME', 'Specified environment variable is not set.')
+client = storage.Client()
+dest_bucket = client.bucket(DEST_BUCKET_NAME)
+# Resumable-upload chunk size; thumbnails under 8 MiB go up in one multipart request
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+# Pillow reports many camera/phone JPEGs as multi-picture 'MPO'
+JPEG_FORMATS = {'JPEG', 'MPO'}
+
 def reformat_image(event, context):
     """Triggered by a change to a Cloud Storage bucket.
     Args:
@@ -10,25 +19,35 @@ def reformat_image(event, context):
          context (google.cloud.functions.Context): Metadata for the event.
     """
     file = event
-    client = storage.Client()
-    source_bucket = client.get_bucket(file['bucket'])
-    source_blob = source_bucket.get_blob(file['name'])
-    image = np.asarray(bytearray(source_blob.download_as_string()), dtype="uint8")
-    image = cv2.imdecode(image, cv2.IMREAD_UNCHANGED)
+    source_bucket = client.bucket(file['bucket'])
+    source_blob = source_bucket.blob(file['name'])
+    image = Image.open(io.BytesIO(source_blob.download_as_bytes()))
+    image_format = image.format
     scale_percent = 50  # percent of original size
-    width = int(image.shape[1] * scale_percent / 100)
-    height = int(image.shape[0] * scale_percent / 100)
+    width = int(image.size[0] * scale_percent / 100)
+    height = int(image.size[1] * scale_percent / 100)
     dim = (width, height)
-    # resize image
-    resized = cv2.resize(image, dim, interpolation=cv2.INTER_AREA)
-    with NamedTemporaryFile() as temp:
-        # Extract name to the temp file
-        temp_file = "".join([str(temp.name), file['name']])
-        # Save image to temp file
-        cv2.imwrite(temp_file, resized)
-        # Uploading the temp image file to the bucket
+    source_size = image.size
+    # let the decoder scale down JPEGs during the IDCT
+    image.draft(image.mode, dim)
+    if image.size == dim:
+        resized = image
+    elif image.size != source_size and all(0 <= s - d <= 1 for s, d in zip(image.size, dim)):
+        # odd-sized JPEGs land one pixel over dim after draft(); crop rather than resample
+        resized = image.crop((0, 0) + dim)
+    else:
+        # resize image
+        resized = image.resize(dim, Image.BOX)
+    with io.BytesIO() as temp:
+        # Encode image in memory
+        if image_format in JPEG_FORMATS:
+            output_format = 'JPEG'
+            resized.save(temp, format=output_format, quality=85, optimize=False)
+        else:
+            output_format = image_format
+            resized.save(temp, format=output_format)
+        # Uploading the encoded image to the bucket
         dest_filename = file['name']
-        dest_bucket_name = os.environ.get('PROCESSED_BUCKET_NAME', 'Specified environment variable is not set.')
-        dest_bucket = client.get_bucket(dest_bucket_name)
         dest_blob = dest_bucket.blob(dest_filename)
-        dest_blob.upload_from_filename(temp_file)
\ No newline at end of file
+        dest_blob.chunk_size = UPLOAD_CHUNK_SIZE
+        dest_blob.upload_from_string(temp.getvalue(), content_type=Image.MIME.get(output_format))
\ No newline at end of file
@@ -1,10 +1,14 @@
-import tempfile
+import mimetypes
 import os
 import cv2
+import numpy as np
 from google.cloud import storage
+from JpegHeader import jpeg_size
 
 
 NEW_FILE_PREFIX="thumbnail_"
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
 client = storage.Client()
 
 
@@ -22,37 +26,62 @@ def main(event, context):
         print(f"Blob {name} is already resized.")
         return
 
-    file_name = download(bucket, name)
-    resize(file_name)
-    upload(bucket, name, file_name)
-
-    os.remove(file_name)
+    data = download(bucket, name)
+    data = resize(name, data)
+    upload(bucket, name, data)
 
 
 def download(bucket, blob_name):
     blob = client.bucket(bucket).blob(blob_name)
-    _, _ext = os.path.splitext(blob.name)
-    _, temp_local_filename = tempfile.mkstemp(suffix=_ext)
-    blob.download_to_filename(temp_local_filename)
-    print(f"Blob {blob_name} downloaded to {temp_local_filename}.")
-    return temp_local_filename
+    data = blob.download_as_bytes()
+    print(f"Blob {blob_name} downloaded ({len(data)} bytes).")
+    return data
 
 
-def upload(bucket, blob_name, file_name):
+def upload(bucket, blob_name, data):
     _dir, _name = os.path.split(blob_name)
     new_file_name = os.path.join(_dir, NEW_FILE_PREFIX + _name)
     new_blob = client.bucket(bucket).blob(new_file_name)
-    new_blob.upload_from_filename(file_name)
+    new_blob.chunk_size = UPLOAD_CHUNK_SIZE
+    content_type, _ = mimetypes.guess_type(_name)
+    new_blob.upload_from_string(data, content_type=content_type)
     print(f'New image uploaded to: gs://{bucket}/{new_file_name}')
 
 
-def resize(file_name):
-    img = cv2.imread(file_name)
-    height = img.shape[0]
-    width = img.shape[1]
-    print(f"Old blob width {width}, height {height}")
+def resize(blob_name, data):
+    _, _ext = os.path.splitext(blob_name)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if _ext.lower() in JPEG_EXTENSIONS:
+        size = jpeg_size(data)
+        if size is not None:
+            print(f"Old blob width {size[0]}, height {size[1]}")
+        # libjpeg decodes straight to 1/2 scale during the IDCT
+        dst = cv2.imdecode(buf, cv2.IMREAD_REDUCED_COLOR_2)
+        if dst is None:
+            raise ValueError(f"Could not decode image {blob_name}")
+        if size is not None:
+            width, height = size
+            if dst.shape[:2] != ((height + 1) // 2, (width + 1) // 2):
+                # EXIF orientation turned the frame by 90 degrees
+                width, height = height, width
+            # the reduced decode rounds odd sizes up; crop to the floor size halve() gives
+            dst = dst[:height // 2, :width // 2]
+    else:
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Could not decode image {blob_name}")
+        height = img.shape[0]
+        width = img.shape[1]
+        print(f"Old blob width {width}, height {height}")
 
-    dst = cv2.resize(img, (int(width/2), int(height/2)))
-    cv2.imwrite(file_name, dst) # requierd ext
+        dst = halve(img)
+    _, encoded = cv2.imencode(_ext, dst) # requierd ext
     print(f"New blob width {dst.shape[0]}, height {dst.shape[1]}")
-    return file_name
\ No newline at end of file
+    return encoded.tobytes()
+
+
+def halve(img):
+    # INTER_AREA at an exact 2x factor runs OpenCV's vectorized 2x2 box average;
+    # an odd trailing row/column would knock it onto the generic area path
+    height, width = img.shape[0] // 2, img.shape[1] // 2
+    return cv2.resize(img[:height * 2, :width * 2], (width, height), interpolation=cv2.INTER_AREA)
\ No newline at end of file
@@ -1,40 +1,212 @@
 
 import os
-from matplotlib import pyplot as plt
+import tempfile
+import threading
 import cv2
+import dlib
+import numpy as np
 import face_recognition as fr
 
 
+#CNN detector only pays off when dlib is built with CUDA (cmake -DDLIB_USE_CUDA=1)
+DETECTION_MODEL = "cnn" if dlib.DLIB_USE_CUDA else "hog"
+#Same default tolerance as fr.compare_faces
+TOLERANCE = 0.6
+#Known-user encodings shared by every request in this worker: path -> (mtime, encoding)
+_KNOWN_ENCODINGS = {}
+
+
+#Registered users stacked as an (N, 128) float32 matrix with their squared norms
+#Rows live in preallocated buffers that double when full; every access holds the lock
+
+class _KnownUsers:
+    def __init__(self, capacity=16):
+        self.lock = threading.Lock()
+        self.matrix = np.empty((capacity, 128), dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+        self.rows = {}   # path -> (row, image mtime when encoded)
+        self.paths = []  # row -> path
+
+    def registered(self, path, mtime):
+        with self.lock:
+            entry = self.rows.get(path)
+        return entry is not None and entry[1] == mtime
+
+    def store(self, path, mtime, encoding):
+        with self.lock:
+            entry = self.rows.get(path)
+            if entry is None:
+                if self.count == len(self.matrix):
+                    self._grow()
+                row = self.count
+                self.count += 1
+                self.paths.append(path)
+            else:
+                row = entry[0]
+            self.matrix[row] = encoding
+            self.sq_norms[row] = encoding @ encoding
+            self.rows[path] = (row, mtime)
+
+    def remove(self, path):
+        with self.lock:
+            entry = self.rows.pop(path, None)
+            if entry is None:
+                return
+            #Move the last row into the gap so rows [0, count) stay contiguous
+            row, last = entry[0], self.count - 1
+            if row != last:
+                moved = self.paths[last]
+                self.matrix[row] = self.matrix[last]
+                self.sq_norms[row] = self.sq_norms[last]
+                self.paths[row] = moved
+                self.rows[moved] = (row, self.rows[moved][1])
+            self.paths.pop()
+            self.count -= 1
+
+    def _grow(self):
+        matrix = np.empty((2 * len(self.matrix), 128), dtype=np.float32)
+        sq_norms = np.empty(2 * len(self.sq_norms), dtype=np.float32)
+        matrix[:self.count] = self.matrix[:self.count]
+        sq_norms[:self.count] = self.sq_norms[:self.count]
+        self.matrix, self.sq_norms = matrix, sq_norms
+
+    def closest(self, query):
+        with self.lock:
+            if not self.count:
+                return None
+            #||k - q||^2 = ||k||^2 - 2 k.q + ||q||^2
+            distances = self.sq_norms[:self.count] - 2 * (self.matrix[:self.count] @ query) + query @ query
+            row = int(np.argmin(distances))
+            path = self.paths[row]
+            return path, self.rows[path][1], distances[row]
+
+_known_users = _KnownUsers()
+
+
 #Function logic checked
 #Accepted to build on
-#Displaying image when path is passed in this function
+#Debug render of the image at the given path, written to /tmp/dbg.png
+#Only called when FR_DEBUG is set
 
 def ShowPic(img):
-    img = cv2.imread(img, 0)
-    plt.imshow(img, cmap = 'gray', interpolation = 'bicubic')
-    plt.xticks([]), plt.yticks([])  # to hide tick values on X and Y axis
-    plt.show()
+    #Imported here so workers that never debug skip matplotlib's startup cost
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    img = cv2.imread(img, cv2.IMREAD_GRAYSCALE)
+    plt.imsave('/tmp/dbg.png', img, cmap = 'gray')
+
+#Encoding of the first face in the image, computed fresh on every call
+#Selfies are untrusted input and must never be served from a cache
+
+def FaceEncoding(path):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Could not decode image {path}")
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    locations = fr.face_locations(img, model=DETECTION_MODEL)
+    return fr.face_encodings(img, known_face_locations=locations, num_jitters=1)[0]
+
+#Write the encoding to a temp file and rename it into place, so a failed write
+#never leaves a truncated file behind and readers never see a partial one
+
+def _save_encoding(enc_path, encoding):
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(enc_path) or '.')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, encoding)
+        os.replace(tmp_path, enc_path)
+    except OSError as e:
+        print("Could not cache encoding : ", e)
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+#Encoding of a known user, persisted next to the image as <path>.enc.npy
+#Recomputed when the image is newer than the saved encoding or the file is unreadable
+
+def LoadOrCompute(path):
+    mtime = os.path.getmtime(path)
+    cached = _KNOWN_ENCODINGS.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    enc_path = path + '.enc.npy'
+    encoding = None
+    if os.path.exists(enc_path) and os.path.getmtime(enc_path) >= mtime:
+        try:
+            encoding = np.load(enc_path)
+        except (ValueError, OSError, EOFError) as e:
+            print("Ignoring unreadable cached encoding : ", e)
+    if encoding is None:
+        encoding = FaceEncoding(path)
+        _save_encoding(enc_path, encoding)
+
+    _KNOWN_ENCODINGS[path] = (mtime, encoding)
+    return encoding
 
 #Function logic checked
 #Accepted to build on
 #Load, Encode, amd compare for single user
 
 def SelfieAuth(auth_image, new_image):
-    user_given_image = fr.load_image_file(auth_image)
-    user_selfie_image = fr.load_image_file(new_image)
-
     try:
-        user_encoding = fr.face_encodings(user_given_image)[0]
-        selfie_encoding = fr.face_encodings(user_selfie_image)[0]
+        user_encoding = LoadOrCompute(auth_image)
+        selfie_encoding = FaceEncoding(new_image)
     except Exception as e:
         print("Error : ", e)
-        ShowPic(new_image)
+        if os.environ.get('FR_DEBUG'):
+            ShowPic(new_image)
         return False
 
-    result = fr.compare_faces([user_encoding], selfie_encoding)
-    ShowPic(new_image)
+    result = bool(np.linalg.norm(user_encoding - selfie_encoding) <= TOLERANCE)
+    if os.environ.get('FR_DEBUG'):
+        ShowPic(new_image)
     return result
 
+#Add a known user to the in-memory matrix searched by IdentifySelfie
+#Registering a path again reuses its row, re-encoding only if the image changed
+
+def RegisterUser(auth_image):
+    mtime = os.path.getmtime(auth_image)
+    if _known_users.registered(auth_image, mtime):
+        return
+    encoding = np.asarray(LoadOrCompute(auth_image), dtype=np.float32)
+    _known_users.store(auth_image, mtime, encoding)
+
+#Find the closest registered user to the selfie with one matrix-vector product
+#Returns the registered image path of the match, or None when no one is within TOLERANCE
+
+def IdentifySelfie(new_image):
+    if not _known_users.count:
+        return None
+    try:
+        query = np.asarray(FaceEncoding(new_image), dtype=np.float32)
+    except Exception as e:
+        print("Error : ", e)
+        return None
+
+    while True:
+        found = _known_users.closest(query)
+        if found is None:
+            return None
+        path, mtime, distance = found
+        if distance > TOLERANCE ** 2:
+            return None
+        try:
+            if os.path.getmtime(path) == mtime:
+                return path
+            #Matched image changed since it was registered: refresh its row and search again
+            RegisterUser(path)
+        except Exception as e:
+            #Matched image was deleted or no longer has a face: drop its row and search again
+            print("Error : ", e)
+            _known_users.remove(path)
+
 
 #Calling defined function
 
@@ -0,0 +1,209 @@
+import os
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("dlib")
+pytest.importorskip("face_recognition")
+
+import FaceRecog
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(FaceRecog, "_KNOWN_ENCODINGS", {})
+    monkeypatch.setattr(FaceRecog, "_known_users", FaceRecog._KnownUsers(capacity=2))
+
+
+def unit(axis, scale=1.0):
+    encoding = np.zeros(128)
+    encoding[axis] = scale
+    return encoding
+
+
+def make_image(tmp_path, name):
+    image = tmp_path / name
+    image.write_bytes(b"img")
+    return str(image)
+
+
+def touch(path, seconds=10):
+    # Move the mtime forward so anything keyed on it sees a new image
+    mtime = os.path.getmtime(path) + seconds
+    os.utime(path, (mtime, mtime))
+
+
+def fake(monkeypatch, name, encodings):
+    # Replace FaceRecog.<name> with a lookup by file name, recording every call
+    calls = []
+
+    def lookup(path):
+        calls.append(path)
+        return encodings[os.path.basename(path)]
+
+    monkeypatch.setattr(FaceRecog, name, lookup)
+    return calls
+
+
+def test_load_or_compute_writes_cache(tmp_path, monkeypatch):
+    path = make_image(tmp_path, "user.jpg")
+    calls = fake(monkeypatch, "FaceEncoding", {"user.jpg": unit(0)})
+
+    encoding = FaceRecog.LoadOrCompute(path)
+
+    assert calls == [path]
+    np.testing.assert_array_equal(np.load(path + ".enc.npy"), encoding)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+
+
+def test_load_or_compute_survives_unwritable_directory(tmp_path, monkeypatch):
+    path = make_image(tmp_path, "user.jpg")
+    fake(monkeypatch, "FaceEncoding", {"user.jpg": unit(0)})
+
+    def mkstemp(*args, **kwargs):
+        raise PermissionError("read-only data directory")
+
+    monkeypatch.setattr(FaceRecog.tempfile, "mkstemp", mkstemp)
+
+    np.testing.assert_array_equal(FaceRecog.LoadOrCompute(path), unit(0))
+    assert not os.path.exists(path + ".enc.npy")
+
+
+def test_load_or_compute_recovers_from_truncated_cache(tmp_path, monkeypatch):
+    path = make_image(tmp_path, "user.jpg")
+    enc_path = path + ".enc.npy"
+    np.save(enc_path, unit(1))
+    with open(enc_path, "r+b") as f:
+        f.truncate(40)
+    touch(enc_path)
+    calls = fake(monkeypatch, "FaceEncoding", {"user.jpg": unit(0)})
+
+    encoding = FaceRecog.LoadOrCompute(path)
+
+    assert calls == [path]
+    np.testing.assert_array_equal(encoding, unit(0))
+    np.testing.assert_array_equal(np.load(enc_path), unit(0))
+
+
+def test_load_or_compute_uses_fresh_cache(tmp_path, monkeypatch):
+    path = make_image(tmp_path, "user.jpg")
+    enc_path = path + ".enc.npy"
+    np.save(enc_path, unit(1))
+    touch(enc_path)
+    calls = fake(monkeypatch, "FaceEncoding", {"user.jpg": unit(0)})
+
+    encoding = FaceRecog.LoadOrCompute(path)
+
+    assert calls == []
+    np.testing.assert_array_equal(encoding, unit(1))
+
+def test_register_user_grows_past_capacity(tmp_path, monkeypatch):
+    names = ["u%d.jpg" % i for i in range(5)]
+    fake(monkeypatch, "LoadOrCompute", {name: unit(i) for i, name in enumerate(names)})
+
+    for name in names:
+        FaceRecog.RegisterUser(make_image(tmp_path, name))
+
+    users = FaceRecog._known_users
+    assert users.count == 5
+    np.testing.assert_array_equal(users.matrix[:5, :5], np.eye(5))
+    np.testing.assert_array_equal(users.sq_norms[:5], np.ones(5))
+
+
+def test_register_user_twice_reuses_row(tmp_path, monkeypatch):
+    calls = fake(monkeypatch, "LoadOrCompute", {"a.jpg": unit(0)})
+    path = make_image(tmp_path, "a.jpg")
+
+    FaceRecog.RegisterUser(path)
+    FaceRecog.RegisterUser(path)
+
+    assert FaceRecog._known_users.count == 1
+    assert calls == [path]
+
+
+def test_register_user_refreshes_changed_image(tmp_path, monkeypatch):
+    encodings = {"a.jpg": unit(0)}
+    fake(monkeypatch, "LoadOrCompute", encodings)
+    path = make_image(tmp_path, "a.jpg")
+    FaceRecog.RegisterUser(path)
+
+    encodings["a.jpg"] = unit(1, 2.0)
+    touch(path)
+    FaceRecog.RegisterUser(path)
+
+    users = FaceRecog._known_users
+    assert users.count == 1
+    np.testing.assert_array_equal(users.matrix[0], unit(1, 2.0))
+    assert users.sq_norms[0] == 4
+
+
+def test_identify_selfie_returns_registered_path(tmp_path, monkeypatch):
+    fake(monkeypatch, "LoadOrCompute", {"a.jpg": unit(0), "b.jpg": unit(1)})
+    a = make_image(tmp_path, "a.jpg")
+    b = make_image(tmp_path, "b.jpg")
+    FaceRecog.RegisterUser(a)
+    FaceRecog.RegisterUser(b)
+    selfies = fake(monkeypatch, "FaceEncoding", {"match.jpg": unit(1, 0.9), "stranger.jpg": unit(2)})
+
+    assert FaceRecog.IdentifySelfie("match.jpg") == b
+    assert FaceRecog.IdentifySelfie("stranger.jpg") is None
+    assert selfies == ["match.jpg", "stranger.jpg"]
+
+
+def test_identify_selfie_without_users(monkeypatch):
+    calls = fake(monkeypatch, "FaceEncoding", {"selfie.jpg": unit(0)})
+
+    assert FaceRecog.IdentifySelfie("selfie.jpg") is None
+    assert calls == []
+
+
+def test_identify_selfie_refreshes_stale_match(tmp_path, monkeypatch):
+    encodings = {"a.jpg": unit(0)}
+    fake(monkeypatch, "LoadOrCompute", encodings)
+    path = make_image(tmp_path, "a.jpg")
+    FaceRecog.RegisterUser(path)
+    fake(monkeypatch, "FaceEncoding", {"selfie.jpg": unit(0)})
+
+    encodings["a.jpg"] = unit(1)
+    touch(path)
+
+    assert FaceRecog.IdentifySelfie("selfie.jpg") is None
+    np.testing.assert_array_equal(FaceRecog._known_users.matrix[0], unit(1))
+
+
+def test_identify_selfie_skips_deleted_user(tmp_path, monkeypatch):
+    fake(monkeypatch, "LoadOrCompute", {"a.jpg": unit(0), "b.jpg": unit(0) + unit(1, 0.1)})
+    a = make_image(tmp_path, "a.jpg")
+    b = make_image(tmp_path, "b.jpg")
+    FaceRecog.RegisterUser(a)
+    FaceRecog.RegisterUser(b)
+    fake(monkeypatch, "FaceEncoding", {"selfie.jpg": unit(0)})
+
+    os.remove(a)
+
+    assert FaceRecog.IdentifySelfie("selfie.jpg") == b
+    users = FaceRecog._known_users
+    assert users.count == 1
+    assert users.rows[b][0] == 0
+    assert users.paths == [b]
+
+
+def test_concurrent_registration_keeps_rows_consistent(tmp_path, monkeypatch):
+    names = ["u%d.jpg" % i for i in range(64)]
+    fake(monkeypatch, "LoadOrCompute", {name: unit(i, i + 1) for i, name in enumerate(names)})
+    paths = [make_image(tmp_path, name) for name in names]
+
+    threads = [threading.Thread(target=FaceRecog.RegisterUser, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    users = FaceRecog._known_users
+    assert users.count == 64
+    for i, path in enumerate(paths):
+        row = users.rows[path][0]
+        np.testing.assert_array_equal(users.matrix[row], unit(i, i + 1))
+        assert users.sq_norms[row] == (i + 1) ** 2
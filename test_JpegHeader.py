@@ -0,0 +1,53 @@
+import struct
+
+from JpegHeader import jpeg_size
+
+
+SOI = b"\xff\xd8"
+
+
+def segment(marker, payload):
+    return b"\xff" + bytes([marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def frame(marker, width, height):
+    return segment(marker, struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00" * 3)
+
+
+def jpeg(*segments):
+    return SOI + b"".join(segments) + b"\xff\xda" + b"\x00" * 32
+
+
+JFIF = segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+DQT = segment(0xDB, b"\x00" + bytes(64))
+DHT = segment(0xC4, b"\x00" + bytes(16) + b"\x00")
+
+
+def test_baseline():
+    assert jpeg_size(jpeg(JFIF, DQT, DHT, frame(0xC0, 641, 481))) == (641, 481)
+
+
+def test_progressive():
+    assert jpeg_size(jpeg(JFIF, DQT, frame(0xC2, 1920, 1080), DHT)) == (1920, 1080)
+
+
+def test_exif_before_frame():
+    exif = segment(0xE1, b"Exif\x00\x00" + b"\xff\xc0\x00\x11" * 100)
+    assert jpeg_size(jpeg(exif, DQT, frame(0xC0, 4032, 3024))) == (4032, 3024)
+
+
+def test_fill_bytes_before_marker():
+    data = jpeg(JFIF, b"\xff\xff" + frame(0xC0, 33, 17))
+    assert jpeg_size(data) == (33, 17)
+
+
+def test_truncated():
+    data = jpeg(JFIF, DQT, frame(0xC0, 641, 481))
+    cut = data.index(b"\xff\xc0") + 6
+    assert jpeg_size(data[:cut]) is None
+    assert jpeg_size(data[:len(SOI) + 10]) is None
+    assert jpeg_size(SOI) is None
+
+
+def test_not_a_jpeg():
+    assert jpeg_size(b"\x89PNG\r\n\x1a\n" + bytes(32)) is None